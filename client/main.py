@@ -4,9 +4,10 @@
 """
 
 import asyncio
-import json
 import logging
 import time
+from collections import deque
+import orjson
 import websockets
 from typing import Optional
 
@@ -14,13 +15,30 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from common.models import Client, Server, Report, Command, CommandType
+from common.models import Client, Server, Command
 from common.system_info import SystemInfo
+from common.protocol import ReportPacker, MAX_BATCH_RECORDS
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 发送队列最多保留的批次数（约1小时的报告），超出时丢弃最早的批次
+OUTBOX_MAX_BATCHES = 720
+
+# WebSocket连接参数：启用permessage-deflate压缩，限制单条消息大小，
+# 通过ping检测失效的对端，无需频繁重建连接
+WS_CONNECT_OPTIONS = {
+    "compression": "deflate",
+    "max_size": 2 ** 20,
+    "ping_interval": 20,
+    "ping_timeout": 20,
+}
+
+# 重连等待时间（秒），失败后指数增长
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+
 
 class OverwatchClient:
     """监控客户端类"""
@@ -32,6 +50,13 @@ class OverwatchClient:
         self.server_url = None
         self.running = False
         self.report_interval = 1  # 报告间隔（秒）
+        self._flush_interval = 5  # 每累积多少次报告合并发送一次
+        self._pending: list[bytes] = []  # 待发送的已打包报告
+        self._report_packer: Optional[ReportPacker] = None
+        # 待发送的报告批次，由发送协程统一取出合并发送，发送失败的批次放回队首
+        self._outbox: deque[list[bytes]] = deque(maxlen=OUTBOX_MAX_BATCHES)
+        self._outbox_ready = asyncio.Event()
+        self._reconnect_delay = RECONNECT_MIN_DELAY
         
     async def start(self):
         """启动客户端"""
@@ -47,34 +72,51 @@ class OverwatchClient:
         
         logger.info(f"Client initialized: {self.client.name} ({self.client.ip})")
         
+        # 预先采集一次负载，使Windows下非阻塞的CPU使用率统计有起始点
+        SystemInfo.get_avg_load()
+        
+        # 报告中CPU核心数在进程生命周期内不变，预先打包
+        self._report_packer = ReportPacker(SystemInfo.get_cpu_count())
+        
         # 主循环
         while self.running:
             try:
-                # 连接到注册中心
-                await self.register_to_center()
+                # 已获取过服务器地址时直接复用，不再重复注册
+                await self._register_once()
+                
+                # 连接到监控服务器，连接断开后返回，下一轮重连同一服务器
+                await self.connect_to_server()
                 
-                # 连接到监控服务器
-                if self.server:
-                    await self.connect_to_server()
-                    
             except Exception as e:
                 logger.error(f"Error in client loop: {e}")
-                await asyncio.sleep(5)  # 出错后等待5秒重试
+                # 无法连接到服务器时重新向注册中心获取服务器地址
+                self.server = None
+                self.server_url = None
+            
+            if self.running:
+                await asyncio.sleep(self._reconnect_delay)
+                self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX_DELAY)
+    
+    async def _register_once(self) -> str:
+        """返回监控服务器地址，仅在尚未获取时向注册中心注册"""
+        if not self.server_url:
+            await self.register_to_center()
+        return self.server_url
     
     async def register_to_center(self):
         """向注册中心注册"""
         try:
-            async with websockets.connect(self.register_url) as websocket:
+            async with websockets.connect(self.register_url, **WS_CONNECT_OPTIONS) as websocket:
                 logger.info(f"Connected to register center: {self.register_url}")
                 
                 # 发送注册命令
                 register_cmd = Command.create_client_register(self.client)
-                await websocket.send(json.dumps(register_cmd.model_dump()))
+                await websocket.send(orjson.dumps(register_cmd.model_dump()).decode())
                 logger.info("Sent registration command")
                 
                 # 接收服务器信息
                 response = await websocket.recv()
-                server_data = json.loads(response)
+                server_data = orjson.loads(response)
                 self.server = Server(**server_data)
                 self.server_url = f"ws://{self.server.ip}:10641/ws"
                 
@@ -91,18 +133,20 @@ class OverwatchClient:
             return
             
         try:
-            async with websockets.connect(self.server_url) as websocket:
+            async with websockets.connect(self.server_url, **WS_CONNECT_OPTIONS) as websocket:
                 logger.info(f"Connected to server: {self.server_url}")
                 
                 # 发送上线命令
-                online_cmd = Command.create_client_online(self.client)
-                await websocket.send(json.dumps(online_cmd.model_dump()))
+                online_cmd = Command.create_client_online(self.client, SystemInfo.get_os_info())
+                await websocket.send(orjson.dumps(online_cmd.model_dump()).decode())
                 logger.info("Sent online command")
                 
-                # 启动定期报告任务
-                report_task = asyncio.create_task(
-                    self.periodic_report(websocket)
-                )
+                # 连接成功，重置重连等待时间
+                self._reconnect_delay = RECONNECT_MIN_DELAY
+                
+                # 启动定期报告任务和发送任务
+                report_task = asyncio.create_task(self.periodic_report())
+                writer_task = asyncio.create_task(self._writer(websocket))
                 
                 # 保持连接并处理响应
                 try:
@@ -114,39 +158,100 @@ class OverwatchClient:
                     logger.warning("Server connection closed")
                 finally:
                     report_task.cancel()
-                    try:
-                        await report_task
-                    except asyncio.CancelledError:
-                        pass
+                    writer_task.cancel()
+                    await asyncio.gather(report_task, writer_task, return_exceptions=True)
                         
         except Exception as e:
             logger.error(f"Failed to connect to server: {e}")
             raise
     
-    async def periodic_report(self, websocket):
-        """定期上报系统状态"""
-        while self.running:
-            try:
-                # 获取系统报告
-                report_data = SystemInfo.get_system_report(self.client.name)
-                report = Report(**report_data)
-                
-                # 创建报告命令
-                report_cmd = Command.create_client_report(report)
-                
-                # 发送报告
-                await websocket.send(json.dumps(report_cmd.model_dump(), default=str))
-                logger.debug(f"Sent report: load={report.load:.2f}, cpus={report.cpus}")
-                
-                # 等待下一次报告
-                await asyncio.sleep(self.report_interval)
-                
-            except asyncio.CancelledError:
-                logger.info("Report task cancelled")
-                break
-            except Exception as e:
-                logger.error(f"Error in periodic report: {e}")
-                await asyncio.sleep(1)  # 出错后等待1秒再试
+    async def periodic_report(self):
+        """定期采集系统状态，多次报告合并为一个批次交给发送协程"""
+        ticks = 0
+        loop = asyncio.get_running_loop()
+        next_t = loop.time()
+        try:
+            while self.running:
+                try:
+                    # 只采集变化的字段，并拼接到预先打包的固定字段上
+                    # 采集放在线程中执行，避免阻塞事件循环
+                    load = await asyncio.to_thread(SystemInfo.get_avg_load)
+                    timestamp = int(time.time() * 1000)
+                    item = self._report_packer.pack(load, timestamp)
+                    self._pending.append(item)
+                    ticks += 1
+                    logger.debug("Queued report: load=%.2f", load)
+                    
+                    # 达到合并次数时提交，单帧记录数上限由发送协程保证
+                    if ticks >= self._flush_interval:
+                        self.flush_reports()
+                        ticks = 0
+                    
+                    # 等待下一次报告，扣除本次采集和发送所用的时间
+                    next_t = await self._sleep_until(next_t + self.report_interval)
+                    
+                except asyncio.CancelledError:
+                    logger.info("Report task cancelled")
+                    break
+                except Exception as e:
+                    logger.error(f"Error in periodic report: {e}")
+                    await asyncio.sleep(1)  # 出错后等待1秒再试
+                    next_t = loop.time()
+        finally:
+            # 连接断开时将未满一批的报告也放入发送队列，重连后与积压的批次一起发送
+            self.flush_reports()
+    
+    @staticmethod
+    async def _sleep_until(deadline: float) -> float:
+        """等待到指定的事件循环时间，返回实际使用的截止时间
+        
+        如果已经错过截止时间则不等待，并以当前时间为新的起点，避免连续补发
+        """
+        loop = asyncio.get_running_loop()
+        delay = deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            return deadline
+        return loop.time()
+    
+    def flush_reports(self):
+        """将缓存的报告作为一个批次放入发送队列"""
+        if not self._pending:
+            return
+        
+        self._outbox.append(self._pending)
+        self._outbox_ready.set()
+        self._pending = []
+    
+    def _requeue(self, records: list[bytes]):
+        """将未发送成功的报告放回队首，队列已满时它们是最早的批次，直接丢弃"""
+        if len(self._outbox) < OUTBOX_MAX_BATCHES:
+            self._outbox.appendleft(records)
+            self._outbox_ready.set()
+        else:
+            logger.warning("Outbox full, dropped %d unsent reports", len(records))
+    
+    async def _writer(self, websocket):
+        """发送协程，将队列中积压的批次合并为一个二进制批量报告帧发送"""
+        while True:
+            while not self._outbox:
+                self._outbox_ready.clear()
+                await self._outbox_ready.wait()
+            records = self._outbox.popleft()
+            
+            # 网络阻塞期间积压的批次一并取出
+            while len(records) < MAX_BATCH_RECORDS and self._outbox:
+                records.extend(self._outbox.popleft())
+            
+            # 报告已提前打包，这里只拼接帧头，bytes会以二进制帧发送，单帧不超过记录数上限
+            # 发送失败或连接断开时取消，未发送的报告放回队列，重连后重新发送
+            for start in range(0, len(records), MAX_BATCH_RECORDS):
+                try:
+                    await websocket.send(ReportPacker.pack_batch(records[start:start + MAX_BATCH_RECORDS]))
+                except BaseException:
+                    self._requeue(records[start:])
+                    raise
+            logger.debug("Sent report batch: %d reports", len(records))
     
     def stop(self):
         """停止客户端"""
@@ -167,4 +272,11 @@ async def main():
 
 
 if __name__ == "__main__":
+    # 优先使用uvloop事件循环（Windows下不可用）
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(main())
\ No newline at end of file
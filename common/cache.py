@@ -0,0 +1,63 @@
+"""
+缓存模块
+使用Redis短时间缓存高频查询的接口结果，Redis不可用时调用方直接回退到数据库查询
+未设置REDIS_URL环境变量时不使用缓存，所有读取均视为未命中
+"""
+
+import logging
+import os
+from typing import Any, Optional
+
+import orjson
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+# Redis服务地址，例如redis://127.0.0.1:6379/0，通过REDIS_URL环境变量配置
+REDIS_URL = os.getenv("REDIS_URL")
+
+# 客户端列表的缓存键和过期时间（秒），服务器和Web界面共用，客户端上下线时由服务器主动失效
+CLIENTS_CACHE_KEY = "clients:online"
+OFFLINE_CACHE_KEY = "clients:offline"
+CLIENTS_CACHE_TTL = 3
+
+logger = logging.getLogger(__name__)
+
+redis = aioredis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5) if REDIS_URL else None
+
+
+async def cache_get(key: str) -> Optional[Any]:
+    """读取缓存，未命中或Redis不可用时返回None"""
+    if redis is None:
+        return None
+    try:
+        data = await redis.get(key)
+    except (RedisError, OSError) as e:
+        logger.debug(f"Cache get failed for {key}: {e}")
+        return None
+    return orjson.loads(data) if data is not None else None
+
+
+async def cache_set(key: str, value: Any, ttl: int):
+    """写入缓存，ttl为过期时间（秒）"""
+    if redis is None:
+        return
+    try:
+        await redis.set(key, orjson.dumps(value), ex=ttl)
+    except (RedisError, OSError) as e:
+        logger.debug(f"Cache set failed for {key}: {e}")
+
+
+async def cache_delete(*keys: str):
+    """删除缓存，数据变化时调用"""
+    if redis is None:
+        return
+    try:
+        await redis.delete(*keys)
+    except (RedisError, OSError) as e:
+        logger.debug(f"Cache delete failed for {keys}: {e}")
+
+
+async def close_cache():
+    """关闭Redis连接池"""
+    if redis is not None:
+        await redis.aclose()
@@ -1,10 +1,13 @@
 """
 数据库模型和操作模块
-使用SQLite作为数据库，SQLAlchemy作为ORM框架
+使用SQLite作为数据库，SQLAlchemy作为ORM框架，通过aiosqlite异步访问
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text
+from sqlalchemy import event, func, insert, select, Column, Index, Integer, String, Float, Boolean, DateTime, Text, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import aliased
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 import os
 
@@ -14,28 +17,67 @@ DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "over
 # 确保数据目录存在
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-# 创建数据库引擎
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False, future=True)
+# 创建异步数据库引擎
+# aiosqlite访问文件数据库时默认使用NullPool，每个会话都新建连接，这里显式使用连接池复用连接
+engine = create_async_engine(
+    f"sqlite+aiosqlite:///{DB_PATH}",
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=20,
+    max_overflow=40,
+    insertmanyvalues_page_size=1000  # 批量插入时每条INSERT语句最多包含的行数
+)
 
-# 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# SQLite连接参数：WAL模式下提交无需每次fsync回滚日志，报告写入为主的场景更合适
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA journal_size_limit=67108864",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """为每个新建的数据库连接设置SQLite参数"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+# 创建会话工厂，提交后不使对象过期，返回的对象在会话关闭后仍可使用
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 # 创建基础模型类
 Base = declarative_base()
 
 
-def get_db():
-    """获取数据库会话"""
-    db = SessionLocal()
-    try:
+async def get_async_db():
+    """获取数据库会话，用于FastAPI依赖注入"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
+# 旧版本中records表的单列索引，已被ix_records_name_ts覆盖
+SUPERSEDED_RECORD_INDEXES = ("ix_records_name", "ix_records_timestamp")
+
+
+def _create_all(connection):
+    """创建所有表和索引"""
+    Base.metadata.create_all(bind=connection)
+    # create_all不会为已存在的表补建索引，这里单独检查
+    for index in Record.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+    # 删除被复合索引取代的单列索引，减少写入时的索引维护
+    for name in SUPERSEDED_RECORD_INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+async def init_db():
     """初始化数据库，创建所有表"""
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as connection:
+        await connection.run_sync(_create_all)
 
 
 class Client(Base):
@@ -58,7 +100,7 @@ class Record(Base):
     __tablename__ = "records"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(50), nullable=False, index=True)
+    name = Column(String(50), nullable=False)
     os = Column(String(255), nullable=False)
     load = Column(Float, nullable=False)
     cpus = Column(Integer, nullable=False)
@@ -68,12 +110,24 @@ class Record(Base):
     disk_total = Column(Float, nullable=False)    # GB
     disk_used = Column(Float, nullable=False)     # GB
     disk_percent = Column(Float, nullable=False)   # 百分比
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # 查询均按名称过滤并按时间倒序，复合索引可直接按索引顺序扫描，无需排序
+    __table_args__ = (
+        Index("ix_records_name_ts", name, timestamp.desc()),
+    )
     
     def __repr__(self):
         return f"<Record(name='{self.name}', load={self.load}, timestamp={self.timestamp})>"
 
 
+# 报告中可选的内存和磁盘指标列
+RECORD_METRIC_COLUMNS = (
+    "memory_total", "memory_used", "memory_percent",
+    "disk_total", "disk_used", "disk_percent",
+)
+
+
 class Server(Base):
     """服务器模型"""
     __tablename__ = "servers"
@@ -139,24 +193,33 @@ class ClientDAO:
     """客户端数据访问对象"""
     
     @staticmethod
-    def get_all(db):
+    async def get_all(db: AsyncSession):
         """获取所有客户端"""
-        return db.query(Client).all()
+        result = await db.execute(select(Client))
+        return result.scalars().all()
     
     @staticmethod
-    def get_online(db):
+    async def get_online(db: AsyncSession):
         """获取在线客户端"""
-        return db.query(Client).filter(Client.online == True).all()
+        result = await db.execute(select(Client).where(Client.online.is_(True)))
+        return result.scalars().all()
+    
+    @staticmethod
+    async def get_offline(db: AsyncSession):
+        """获取离线客户端"""
+        result = await db.execute(select(Client).where(Client.online.is_(False)))
+        return result.scalars().all()
     
     @staticmethod
-    def get_by_name(db, name):
+    async def get_by_name(db: AsyncSession, name):
         """根据名称获取客户端"""
-        return db.query(Client).filter(Client.name == name).first()
+        result = await db.execute(select(Client).where(Client.name == name))
+        return result.scalars().first()
     
     @staticmethod
-    def create_or_update(db, name, ip, online=True):
+    async def create_or_update(db: AsyncSession, name, ip, online=True):
         """创建或更新客户端"""
-        client = db.query(Client).filter(Client.name == name).first()
+        client = await ClientDAO.get_by_name(db, name)
         if client:
             client.ip = ip
             client.online = online
@@ -164,27 +227,26 @@ class ClientDAO:
         else:
             client = Client(name=name, ip=ip, online=online)
             db.add(client)
-        db.commit()
-        db.refresh(client)
+        await db.commit()
         return client
     
     @staticmethod
-    def set_offline(db, name):
+    async def set_offline(db: AsyncSession, name):
         """设置客户端为离线状态"""
-        client = db.query(Client).filter(Client.name == name).first()
+        client = await ClientDAO.get_by_name(db, name)
         if client:
             client.online = False
-            db.commit()
+            await db.commit()
             return True
         return False
     
     @staticmethod
-    def delete(db, name):
+    async def delete(db: AsyncSession, name):
         """删除客户端"""
-        client = db.query(Client).filter(Client.name == name).first()
+        client = await ClientDAO.get_by_name(db, name)
         if client:
-            db.delete(client)
-            db.commit()
+            await db.delete(client)
+            await db.commit()
             return True
         return False
 
@@ -193,116 +255,185 @@ class RecordDAO:
     """记录数据访问对象"""
     
     @staticmethod
-    def create(db, record_data):
+    async def create(db: AsyncSession, record_data):
         """创建新记录"""
         record = Record(**record_data)
         db.add(record)
-        db.commit()
-        db.refresh(record)
+        await db.commit()
         return record
     
     @staticmethod
-    def get_by_client(db, name, limit=100):
+    async def bulk_create(db: AsyncSession, records_data):
+        """在一个事务中批量创建记录，缺失的内存和磁盘指标按0写入"""
+        if not records_data:
+            return 0
+        # 客户端目前只上报负载，这些列不允许为空，批量插入时每行还必须包含相同的列
+        for record in records_data:
+            for column in RECORD_METRIC_COLUMNS:
+                if record.get(column) is None:
+                    record[column] = 0.0
+        await db.execute(insert(Record), records_data)
+        await db.commit()
+        return len(records_data)
+    
+    @staticmethod
+    async def get_by_client(db: AsyncSession, name, limit=100):
         """获取客户端的最新记录"""
-        return db.query(Record).filter(
-            Record.name == name
-        ).order_by(Record.timestamp.desc()).limit(limit).all()
+        result = await db.execute(
+            select(Record).where(
+                Record.name == name
+            ).order_by(Record.timestamp.desc()).limit(limit)
+        )
+        return result.scalars().all()
     
     @staticmethod
-    def get_by_timerange(db, name, start_time, end_time):
+    async def get_by_timerange(db: AsyncSession, name, start_time, end_time):
         """获取指定时间范围内的记录"""
-        return db.query(Record).filter(
-            Record.name == name,
-            Record.timestamp >= start_time,
-            Record.timestamp <= end_time
-        ).order_by(Record.timestamp.desc()).all()
+        result = await db.execute(
+            select(Record).where(
+                Record.name == name,
+                Record.timestamp >= start_time,
+                Record.timestamp <= end_time
+            ).order_by(Record.timestamp.desc())
+        )
+        return result.scalars().all()
+    
+    @staticmethod
+    async def stream_by_timerange(db: AsyncSession, name, start_time, end_time, batch_size=1000):
+        """分批获取指定时间范围内的记录，每批最多batch_size行，只查询接口需要的列"""
+        result = await db.stream(
+            select(Record.id, Record.name, Record.load, Record.cpus, Record.os, Record.timestamp).where(
+                Record.name == name,
+                Record.timestamp >= start_time,
+                Record.timestamp <= end_time
+            ).order_by(Record.timestamp.desc()).execution_options(yield_per=batch_size)
+        )
+        async for rows in result.partitions():
+            yield rows
     
     @staticmethod
-    def get_latest_by_client(db, name):
+    async def get_latest_by_client(db: AsyncSession, name):
         """获取客户端的最新记录"""
-        return db.query(Record).filter(
-            Record.name == name
-        ).order_by(Record.timestamp.desc()).first()
+        result = await db.execute(
+            select(Record).where(
+                Record.name == name
+            ).order_by(Record.timestamp.desc()).limit(1)
+        )
+        return result.scalars().first()
     
     @staticmethod
-    def get_all_latest(db):
+    async def get_all_latest(db: AsyncSession):
         """获取所有客户端的最新记录"""
-        # 使用子查询获取每个客户端的最新记录ID
-        subquery = db.query(
-            Record.name,
-            db.func.max(Record.timestamp).label('max_timestamp')
-        ).group_by(Record.name).subquery()
+        # 使用窗口函数为每个客户端的记录按时间倒序编号，取编号为1的记录
+        ranked = select(
+            Record,
+            func.row_number().over(
+                partition_by=Record.name,
+                order_by=Record.timestamp.desc()
+            ).label("rn")
+        ).subquery()
+        latest = aliased(Record, ranked)
         
-        return db.query(Record).join(
-            subquery,
-            (Record.name == subquery.c.name) & 
-            (Record.timestamp == subquery.c.max_timestamp)
-        ).all()
+        result = await db.execute(select(latest).where(ranked.c.rn == 1))
+        return result.scalars().all()
 
 
 class AlertDAO:
     """告警数据访问对象"""
     
     @staticmethod
-    def create(db, alert_data):
+    async def create(db: AsyncSession, alert_data):
         """创建新告警"""
         alert = Alert(**alert_data)
         db.add(alert)
-        db.commit()
-        db.refresh(alert)
+        await db.commit()
         return alert
     
     @staticmethod
-    def get_unresolved(db):
+    async def get_unresolved(db: AsyncSession):
         """获取未解决的告警"""
-        return db.query(Alert).filter(Alert.resolved == False).all()
+        result = await db.execute(select(Alert).where(Alert.resolved.is_(False)))
+        return result.scalars().all()
     
     @staticmethod
-    def resolve(db, alert_id):
+    async def resolve(db: AsyncSession, alert_id):
         """解决告警"""
-        alert = db.query(Alert).filter(Alert.id == alert_id).first()
+        result = await db.execute(select(Alert).where(Alert.id == alert_id))
+        alert = result.scalars().first()
         if alert:
             alert.resolved = True
             alert.resolved_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
             return True
         return False
 
 
+def _uniform_rows(rows):
+    """补齐各行缺少的列为None，多行VALUES插入要求每行包含相同的列"""
+    columns = {column for row in rows for column in row}
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
 class ConfigDAO:
     """配置数据访问对象"""
     
     @staticmethod
-    def get_all(db):
+    async def get_all(db: AsyncSession):
         """获取所有配置"""
-        return db.query(Config).all()
+        result = await db.execute(select(Config))
+        return result.scalars().all()
     
     @staticmethod
-    def get_by_key(db, key):
+    async def get_by_key(db: AsyncSession, key):
         """根据键获取配置"""
-        return db.query(Config).filter(Config.key == key).first()
+        result = await db.execute(select(Config).where(Config.key == key))
+        return result.scalars().first()
     
     @staticmethod
-    def set(db, key, value, description=None):
+    async def set(db: AsyncSession, key, value, description=None):
         """设置配置"""
-        config = db.query(Config).filter(Config.key == key).first()
+        config = await ConfigDAO.get_by_key(db, key)
         if config:
             config.value = value
             config.description = description
         else:
             config = Config(key=key, value=value, description=description)
             db.add(config)
-        db.commit()
-        db.refresh(config)
+        await db.commit()
         return config
     
     @staticmethod
-    def delete(db, key):
+    async def upsert_many(db: AsyncSession, rows):
+        """批量设置配置，rows为包含key和value的字典列表，一条语句完成插入或更新
+        
+        已存在的键只更新值和更新时间，保留原有描述
+        """
+        if not rows:
+            return
+        stmt = sqlite_insert(Config).values(_uniform_rows(rows))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Config.key],
+            set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at}
+        )
+        await db.execute(stmt)
+        await db.commit()
+    
+    @staticmethod
+    async def insert_missing(db: AsyncSession, rows):
+        """批量插入不存在的配置，已存在的键保持不变，不提交事务，由调用方统一提交"""
+        if not rows:
+            return
+        await db.execute(
+            sqlite_insert(Config).values(_uniform_rows(rows)).on_conflict_do_nothing(index_elements=[Config.key])
+        )
+    
+    @staticmethod
+    async def delete(db: AsyncSession, key):
         """删除配置"""
-        config = db.query(Config).filter(Config.key == key).first()
+        config = await ConfigDAO.get_by_key(db, key)
         if config:
-            db.delete(config)
-            db.commit()
+            await db.delete(config)
+            await db.commit()
             return True
         return False
 
@@ -311,30 +442,31 @@ class UserDAO:
     """用户数据访问对象"""
     
     @staticmethod
-    def get_all(db):
+    async def get_all(db: AsyncSession):
         """获取所有用户"""
-        return db.query(User).all()
+        result = await db.execute(select(User))
+        return result.scalars().all()
     
     @staticmethod
-    def get_by_username(db, username):
+    async def get_by_username(db: AsyncSession, username):
         """根据用户名获取用户"""
-        return db.query(User).filter(User.username == username).first()
+        result = await db.execute(select(User).where(User.username == username))
+        return result.scalars().first()
     
     @staticmethod
-    def create(db, user_data):
+    async def create(db: AsyncSession, user_data):
         """创建新用户"""
         user = User(**user_data)
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
         return user
     
     @staticmethod
-    def update_login_time(db, username):
+    async def update_login_time(db: AsyncSession, username):
         """更新用户登录时间"""
-        user = db.query(User).filter(User.username == username).first()
+        user = await UserDAO.get_by_username(db, username)
         if user:
             user.last_login = datetime.utcnow()
-            db.commit()
+            await db.commit()
             return True
         return False
\ No newline at end of file
@@ -209,24 +209,20 @@ class Command(BaseModel):
         )
     
     @classmethod
-    def create_client_online(cls, client: Client):
-        """创建客户端上线命令"""
+    def create_client_online(cls, client: Client, os: Optional[str] = None):
+        """创建客户端上线命令，操作系统信息只在上线时发送一次"""
         return cls(
             type="CLIENT_ONLINE",
-            contents={"client": client.model_dump()}
+            contents={"client": client.model_dump(), "os": os}
         )
     
     @classmethod
     def create_client_report(cls, report: Report):
         """创建客户端报告命令"""
-        # 使用自定义序列化方法处理datetime对象
-        report_dict = report.model_dump()
-        if report_dict.get("timestamp") and isinstance(report_dict["timestamp"], datetime):
-            report_dict["timestamp"] = report_dict["timestamp"].isoformat()
-            
+        # datetime对象由orjson直接序列化，无需预先转换
         return cls(
             type="CLIENT_REPORT",
-            contents={"report": report_dict}
+            contents={"report": report.model_dump()}
         )
     
     @classmethod
@@ -0,0 +1,58 @@
+"""
+二进制通信协议
+周期性报告使用带类型标记的定长二进制帧，握手命令仍使用JSON文本帧
+"""
+
+import struct
+from typing import Any, Dict, List
+
+
+class FrameType:
+    """二进制帧类型标记，占用帧的第一个字节"""
+    CLIENT_REPORT_BATCH = 0x01
+
+
+# 报告记录：负载(float64，保持客户端采集的精度)、CPU核心数(uint32)、毫秒时间戳(uint64)
+# 客户端名称和操作系统信息在上线命令中发送一次，由服务器按连接补全，不包含在每条报告中
+REPORT_STRUCT = struct.Struct("<dIQ")
+
+# 批量报告帧头：类型标记(uint8)、记录数(uint16)
+BATCH_HEADER_STRUCT = struct.Struct("<BH")
+
+# 单个批量报告帧最多包含的记录数
+MAX_BATCH_RECORDS = 0xFFFF
+
+
+class ReportPacker:
+    """报告打包工具，进程内不变的字段只编码一次"""
+
+    def __init__(self, cpus: int):
+        self._cpus = cpus
+
+    def pack(self, load: float, timestamp: int) -> bytes:
+        """打包单条报告记录"""
+        return REPORT_STRUCT.pack(load, self._cpus, timestamp)
+
+    @staticmethod
+    def pack_batch(records: List[bytes]) -> bytes:
+        """将已打包的报告记录组合为一个批量报告帧"""
+        return (
+            BATCH_HEADER_STRUCT.pack(FrameType.CLIENT_REPORT_BATCH, len(records))
+            + b"".join(records)
+        )
+
+
+def unpack_report_batch(data: bytes) -> List[Dict[str, Any]]:
+    """解析批量报告帧（不含类型检查），返回报告字典列表，不含客户端名称"""
+    _, count = BATCH_HEADER_STRUCT.unpack_from(data)
+    body = memoryview(data)[BATCH_HEADER_STRUCT.size:]
+    if len(body) != count * REPORT_STRUCT.size:
+        raise ValueError(f"Malformed report batch: {count} records, {len(body)} bytes")
+    return [
+        {
+            "load": load,
+            "cpus": cpus,
+            "timestamp": timestamp
+        }
+        for load, cpus, timestamp in REPORT_STRUCT.iter_unpack(body)
+    ]
@@ -0,0 +1,69 @@
+"""
+接口查询模块
+服务器和Web界面共用的只读查询，两个进程返回相同的结构并共用同一组缓存
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import cache_get, cache_set, CLIENTS_CACHE_KEY, OFFLINE_CACHE_KEY, CLIENTS_CACHE_TTL
+from .database import AsyncSessionLocal, ClientDAO, RecordDAO
+
+
+def client_to_dict(client, online: bool) -> Dict[str, Any]:
+    """将客户端转换为接口返回的字典"""
+    return {
+        "ip": client.ip,
+        "name": client.name,
+        "online": online
+    }
+
+
+def record_to_dict(record) -> Dict[str, Any]:
+    """将报告记录转换为接口返回的字典"""
+    return {
+        "avgload": record.load,
+        "cpunum": record.cpus,
+        "id": record.id,
+        "name": record.name,
+        "os": record.os,
+        "timestamp": int(record.timestamp.timestamp() * 1000)  # 转换为毫秒时间戳
+    }
+
+
+async def get_online_clients(db: AsyncSession) -> List[Dict[str, Any]]:
+    """获取数据库中所有在线的客户端"""
+    cached = await cache_get(CLIENTS_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    result = [client_to_dict(client, client.online) for client in await ClientDAO.get_online(db)]
+    await cache_set(CLIENTS_CACHE_KEY, result, CLIENTS_CACHE_TTL)
+    return result
+
+
+async def get_offline_clients(db: AsyncSession) -> List[Dict[str, Any]]:
+    """获取数据库中所有离线的客户端"""
+    cached = await cache_get(OFFLINE_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    result = [client_to_dict(client, False) for client in await ClientDAO.get_offline(db)]
+    await cache_set(OFFLINE_CACHE_KEY, result, CLIENTS_CACHE_TTL)
+    return result
+
+
+async def iter_reports_json(name: str, start_dt: datetime, end_dt: datetime):
+    """分批查询报告并逐批编码为JSON数组的片段，内存占用与时间范围无关"""
+    yield b"["
+    separator = b""
+    async with AsyncSessionLocal() as db:
+        async for rows in RecordDAO.stream_by_timerange(db, name, start_dt, end_dt):
+            chunk = orjson.dumps([record_to_dict(row) for row in rows])
+            # 去掉每批的方括号，批之间用逗号连接
+            yield separator + chunk[1:-1]
+            separator = b","
+    yield b"]"
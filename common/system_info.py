@@ -1,13 +1,36 @@
+import functools
+import os
 import psutil
 import platform
 import time
 from typing import Dict, Any
 
+# 操作系统信息在进程启动时确定一次
+_SYSTEM = platform.system()
+_OS_INFO = f"{platform.machine()}{_SYSTEM}{platform.release()}"
+
+
+def _open_loadavg():
+    """Linux下打开/proc/loadavg并在进程内保持打开，失败时回退到psutil"""
+    if _SYSTEM != "Linux":
+        return None
+    try:
+        return os.open("/proc/loadavg", os.O_RDONLY)
+    except OSError:
+        return None
+
+
+_LOADAVG_FD = _open_loadavg()
+
 
 class SystemInfo:
-    """系统信息获取工具类"""
+    """系统信息获取工具类
+    
+    CPU核心数、操作系统信息和本机IP在进程生命周期内不变，首次获取后缓存
+    """
     
     @staticmethod
+    @functools.cache
     def get_cpu_count() -> int:
         """获取CPU核心数"""
         return psutil.cpu_count(logical=True)
@@ -16,9 +39,14 @@ class SystemInfo:
     def get_avg_load() -> float:
         """获取系统平均负载"""
         # Windows系统使用CPU使用率作为负载指标
-        if platform.system() == "Windows":
-            return psutil.cpu_percent(interval=1) / 100.0
-        # Unix系统可以使用getloadavg
+        # 非阻塞模式返回距上次调用以来的使用率，首次调用结果无意义，需要预先调用一次
+        if _SYSTEM == "Windows":
+            return psutil.cpu_percent(interval=None) / 100.0
+        # Linux系统直接读取/proc/loadavg，每次只需一次系统调用
+        elif _LOADAVG_FD is not None:
+            data = os.pread(_LOADAVG_FD, 128, 0)
+            return float(data.split(b" ", 1)[0])
+        # 其他Unix系统使用getloadavg
         else:
             load1, _, _ = psutil.getloadavg()
             return load1
@@ -26,9 +54,10 @@ class SystemInfo:
     @staticmethod
     def get_os_info() -> str:
         """获取操作系统信息"""
-        return f"{platform.machine()}{platform.system()}{platform.release()}"
+        return _OS_INFO
     
     @staticmethod
+    @functools.cache
     def get_local_ip() -> str:
         """获取本机IP地址"""
         import socket
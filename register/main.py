@@ -4,9 +4,11 @@
 """
 
 import asyncio
-import json
 import logging
-from typing import Dict, List, Optional
+import uuid
+from typing import Dict, Union
+import orjson
+from pydantic import TypeAdapter
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 
@@ -16,13 +18,17 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from common.models import Client, Server, Command, CommandType
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志，默认只输出警告及以上级别，可通过LOG_LEVEL环境变量调整
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 logger = logging.getLogger(__name__)
 
 # 创建FastAPI应用
 app = FastAPI(title="Overwatch Register Service", version="1.0.0")
 
+# 预先构建的校验器，避免每条消息重复解析模型结构
+COMMAND_ADAPTER = TypeAdapter(Command)
+CLIENT_ADAPTER = TypeAdapter(Client)
+
 # 存储注册信息
 registered_clients: Dict[str, Client] = {}
 registered_servers: Dict[str, Server] = {}
@@ -30,25 +36,47 @@ registered_servers: Dict[str, Server] = {}
 # WebSocket连接管理
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # 以会话ID为键保存连接，结构性修改在锁内进行
+        self.connections: Dict[str, WebSocket] = {}
+        self._lock = asyncio.Lock()
     
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> str:
+        """接受连接并返回该连接的会话ID"""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        sid = uuid.uuid4().hex
+        async with self._lock:
+            self.connections[sid] = websocket
+        return sid
+    
+    async def disconnect(self, sid: str):
+        async with self._lock:
+            self.connections.pop(sid, None)
     
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    async def send_personal_message(self, message: Union[str, bytes], websocket: WebSocket):
+        if isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message)
     
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+    async def send_to(self, sid: str, message: Union[str, bytes]):
+        """向指定会话发送消息"""
+        websocket = self.connections.get(sid)
+        if websocket:
+            await self.send_personal_message(message, websocket)
     
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                # 连接已断开，移除
-                self.active_connections.remove(connection)
+        # 先取快照，避免与其他任务的连接增删冲突，然后并发发送
+        sessions = tuple(self.connections.items())
+        results = await asyncio.gather(
+            *(websocket.send_text(message) for _, websocket in sessions),
+            return_exceptions=True
+        )
+        # 发送失败的连接已断开，移除
+        dead = [sid for (sid, _), result in zip(sessions, results) if isinstance(result, Exception)]
+        if dead:
+            async with self._lock:
+                for sid in dead:
+                    self.connections.pop(sid, None)
 
 manager = ConnectionManager()
 
@@ -83,23 +111,22 @@ async def get_client(client_name: str):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket端点，处理客户端和服务器的连接"""
-    await manager.connect(websocket)
+    sid = await manager.connect(websocket)
     try:
         while True:
             # 接收消息
             data = await websocket.receive_text()
-            logger.info(f"Received message: {data}")
+            logger.debug("Received message: %s", data)
             
             try:
-                # 解析命令
-                command_data = json.loads(data)
-                command = Command(**command_data)
+                # 解析命令，JSON解析和校验一次完成
+                command = COMMAND_ADAPTER.validate_json(data)
                 
                 # 处理不同类型的命令
                 if command.type == CommandType.CLIENT_REGIST:
                     # 客户端注册
                     client_data = command.contents.get("client")
-                    client = Client(**client_data)
+                    client = CLIENT_ADAPTER.validate_python(client_data)
                     registered_clients[client.name] = client
                     logger.info(f"Client registered: {client.name}")
                     
@@ -107,14 +134,14 @@ async def websocket_endpoint(websocket: WebSocket):
                     if registered_servers:
                         # 返回第一个可用的服务器
                         server = list(registered_servers.values())[0]
-                        await manager.send_personal_message(
-                            json.dumps(server.model_dump()), websocket
+                        await manager.send_to(
+                            sid, orjson.dumps(server.model_dump()).decode()
                         )
                 
                 elif command.type == CommandType.CLIENT_ONLINE:
                     # 客户端上线
                     client_data = command.contents.get("client")
-                    client = Client(**client_data)
+                    client = CLIENT_ADAPTER.validate_python(client_data)
                     registered_clients[client.name] = client
                     logger.info(f"Client online: {client.name}")
                 
@@ -130,23 +157,27 @@ async def websocket_endpoint(websocket: WebSocket):
                     
             except Exception as e:
                 logger.error(f"Error processing command: {e}")
-                await manager.send_personal_message(
-                    json.dumps({"error": str(e)}), websocket
+                await manager.send_to(
+                    sid, orjson.dumps({"error": str(e)}).decode()
                 )
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        await manager.disconnect(sid)
         logger.info("WebSocket disconnected")
 
 
 if __name__ == "__main__":
     import uvicorn
     
-    # 启动服务
+    # 启动服务，使用uvloop事件循环和httptools解析器（uvloop不支持Windows）
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=10640,
-        reload=True,
-        log_level="info"
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        ws="websockets",
+        ws_per_message_deflate=True,
+        reload=False,
+        log_level="warning"
     )
\ No newline at end of file
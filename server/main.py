@@ -4,13 +4,17 @@
 """
 
 import asyncio
-import json
 import logging
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
+import orjson
 from contextlib import asynccontextmanager
+from datetime import datetime
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends
-from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import TypeAdapter
 
 import sys
 import os
@@ -18,74 +22,179 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from common.models import Client, Server, Report, Command, CommandType
 from common.system_info import SystemInfo
-from common.database import get_db, init_db, ClientDAO, RecordDAO, AlertDAO
+from common.database import AsyncSessionLocal, get_async_db, init_db, ClientDAO, RecordDAO, AlertDAO
+from common.protocol import FrameType, unpack_report_batch
+from common.cache import cache_delete, close_cache, CLIENTS_CACHE_KEY, OFFLINE_CACHE_KEY
+from common.queries import client_to_dict, get_online_clients, get_offline_clients, iter_reports_json
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志，默认只输出警告及以上级别，可通过LOG_LEVEL环境变量调整
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 logger = logging.getLogger(__name__)
 
+# 预先构建的校验器，避免每条消息重复解析模型结构
+COMMAND_ADAPTER = TypeAdapter(Command)
+REPORT_ADAPTER = TypeAdapter(Report)
+CLIENT_ADAPTER = TypeAdapter(Client)
+
+# 向注册中心注册的最大尝试次数，每次失败后等待1、2、4、8秒
+REGISTER_MAX_ATTEMPTS = 5
+
+# 报告写入队列，由后台任务批量写入数据库
+REPORT_QUEUE_SIZE = 50_000
+REPORT_BATCH_SIZE = 1000
+REPORT_FLUSH_INTERVAL = 0.5  # 秒
+report_queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=REPORT_QUEUE_SIZE)
+
 # 存储客户端状态和报告数据（临时缓存，用于实时通信）
 registered_clients: Dict[str, Client] = {}
-offline_clients: List[Client] = []
+offline_clients: Dict[str, Client] = {}
 
 # WebSocket连接管理
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
     
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
+    
+    async def broadcast(self, message: bytes):
+        # 先取快照，并发发送，发送失败的连接已断开，移除
+        connections = tuple(self.active_connections)
+        results = await asyncio.gather(
+            *(websocket.send_bytes(message) for websocket in connections),
+            return_exceptions=True
+        )
+        for websocket, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.active_connections.discard(websocket)
 
 manager = ConnectionManager()
+# 仪表板连接单独管理，只接收客户端上下线通知
+dashboard_manager = ConnectionManager()
+# 持有后台通知任务的引用，避免任务未完成时被回收
+background_tasks = set()
+
+
+def notify_dashboards(event_type: str, client: Client):
+    """在后台向所有仪表板推送客户端状态变化，不阻塞当前连接的消息处理"""
+    if not dashboard_manager.active_connections:
+        return
+    payload = orjson.dumps({"type": event_type, "client": client.model_dump()})
+    task = asyncio.create_task(dashboard_manager.broadcast(payload))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """服务器生命周期管理"""
     # 启动时初始化数据库并向注册中心注册
     # 初始化数据库
-    init_db()
+    await init_db()
     logger.info("Database initialized")
     
     # 向注册中心注册（在后台任务中）
     asyncio.create_task(register_to_register_center())
     
+    # 启动报告批量写入任务
+    flush_task = asyncio.create_task(flush_reports_loop())
+    
     yield
     
-    # 关闭时的清理工作（如果需要）
+    # 关闭时停止写入任务，并写入队列中剩余的报告
+    flush_task.cancel()
+    await asyncio.gather(flush_task, return_exceptions=True)
+    rows = []
+    while not report_queue.empty():
+        rows.append(report_queue.get_nowait())
+    if rows:
+        await save_reports(rows)
+    
+    await close_cache()
 
 # 创建FastAPI应用
-app = FastAPI(title="Overwatch Server Service", version="1.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="Overwatch Server Service",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+# 压缩较大的JSON响应，小于1KB的响应不压缩
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 
 async def register_to_register_center():
-    """向注册中心注册服务器"""
+    """向注册中心注册服务器，失败时按指数退避重试"""
     import websockets
     
     register_url = "ws://127.0.0.1:10640/ws"
     
-    try:
-        async with websockets.connect(register_url) as websocket:
-            # 创建服务器上线命令
-            server = Server(ip=SystemInfo.get_local_ip())
-            command = Command.create_server_online(server)
-            
-            # 发送注册命令
-            await websocket.send(json.dumps(command.model_dump()))
+    # 创建服务器上线命令
+    server = Server(ip=SystemInfo.get_local_ip())
+    payload = orjson.dumps(Command.create_server_online(server).model_dump()).decode()
+    
+    for attempt in range(REGISTER_MAX_ATTEMPTS):
+        try:
+            # 发送注册命令后立即关闭连接
+            async with websockets.connect(register_url) as websocket:
+                await websocket.send(payload)
             logger.info(f"Server registered to register center: {server.ip}")
-            
-            # 保持连接一段时间后退出，让服务器能够正常启动
-            await asyncio.sleep(5)
-                
+            return
+        except Exception as e:
+            logger.warning(f"Failed to register to register center (attempt {attempt + 1}): {e}")
+            if attempt + 1 < REGISTER_MAX_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+    
+    logger.error(f"Giving up registering to register center after {REGISTER_MAX_ATTEMPTS} attempts")
+
+
+async def save_reports(records: List[dict]):
+    """将一批报告在一个事务中存储到数据库"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await RecordDAO.bulk_create(db, records)
+        logger.debug("Saved %d reports to database", len(records))
     except Exception as e:
-        logger.error(f"Failed to register to register center: {e}")
-        # 不再重试，避免阻塞服务器启动
+        logger.error(f"Error saving report batch to database: {e}")
+
+
+async def flush_reports_loop():
+    """后台任务，从报告队列中取出报告，按条数或时间间隔批量写入数据库"""
+    loop = asyncio.get_running_loop()
+    while True:
+        rows = [await report_queue.get()]
+        try:
+            deadline = loop.time() + REPORT_FLUSH_INTERVAL
+            while len(rows) < REPORT_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                # 不使用wait_for：取消与取出同时发生时wait_for会吞掉取消，导致关闭时任务无法退出
+                getter = asyncio.ensure_future(report_queue.get())
+                try:
+                    await asyncio.wait((getter,), timeout=timeout)
+                finally:
+                    # 超时或取消时停止等待，已取出的报告不能丢弃
+                    received = getter.done()
+                    if received:
+                        rows.append(getter.result())
+                    else:
+                        getter.cancel()
+                if not received:
+                    break
+        except asyncio.CancelledError:
+            # 关闭时写入已取出的报告
+            await save_reports(rows)
+            raise
+        
+        await save_reports(rows)
 
 
 @app.get("/")
@@ -95,22 +204,9 @@ async def root():
 
 
 @app.get("/clients")
-async def get_clients():
+async def get_clients(db: AsyncSession = Depends(get_async_db)):
     """获取当前所有在线的客户端"""
-    # 从数据库获取所有客户端
-    db = next(get_db())
-    try:
-        db_clients = ClientDAO.get_online(db)
-        return [
-            {
-                "ip": client.ip,
-                "name": client.name,
-                "online": client.online
-            }
-            for client in db_clients
-        ]
-    finally:
-        db.close()
+    return await get_online_clients(db)
 
 
 @app.get("/client")
@@ -120,89 +216,50 @@ async def get_client_reports(
     endtime: int = Query(int(time.time() * 1000), description="结束时间戳（毫秒）")
 ):
     """获取特定客户端的状态报告"""
-    # 从数据库获取记录
-    db = next(get_db())
-    try:
-        # 转换时间戳为datetime对象
-        from datetime import datetime
-        start_dt = datetime.fromtimestamp(starttime / 1000)
-        end_dt = datetime.fromtimestamp(endtime / 1000)
-        
-        # 查询指定时间范围内的记录
-        records = RecordDAO.get_by_timerange(db, name, start_dt, end_dt)
-        
-        return [
-            {
-                "avgload": record.load,
-                "cpunum": record.cpus,
-                "id": record.id,
-                "name": record.name,
-                "os": record.os,
-                "timestamp": int(record.timestamp.timestamp() * 1000)  # 转换为毫秒时间戳
-            }
-            for record in records
-        ]
-    finally:
-        db.close()
+    # 转换时间戳为datetime对象
+    start_dt = datetime.fromtimestamp(starttime / 1000)
+    end_dt = datetime.fromtimestamp(endtime / 1000)
+    
+    # 流式返回指定时间范围内的记录
+    return StreamingResponse(iter_reports_json(name, start_dt, end_dt), media_type="application/json")
 
 
 @app.get("/alert")
-async def get_offline_clients():
+async def get_alerts(db: AsyncSession = Depends(get_async_db)):
     """获取掉线的客户端"""
-    # 从数据库获取离线客户端
-    db = next(get_db())
-    try:
-        # 获取所有客户端，筛选离线的
-        all_clients = ClientDAO.get_all(db)
-        offline_db_clients = [
-            {
-                "ip": client.ip,
-                "name": client.name,
-                "online": False
-            }
-            for client in all_clients
-            if not client.online
-        ]
-        
-        # 添加临时离线客户端（从内存中的列表）
-        for client in offline_clients:
-            # 检查是否已在数据库中
-            if not any(c["name"] == client.name for c in offline_db_clients):
-                offline_db_clients.append({
-                    "ip": client.ip,
-                    "name": client.name,
-                    "online": False
-                })
-        
-        return offline_db_clients
-    finally:
-        db.close()
+    # 缓存中只保存数据库查询结果，与Web界面共用
+    result = await get_offline_clients(db)
+    seen = {client["name"] for client in result}
+    
+    # 添加数据库状态未能更新的临时离线客户端（从内存中的列表）
+    extra = [
+        client_to_dict(client, False)
+        for client in offline_clients.values()
+        if client.name not in seen
+    ]
+    return result + extra if extra else result
 
 
 @app.get("/delclient")
-async def delete_client(name: str = Query(..., description="客户端名称")):
+async def delete_client(
+    name: str = Query(..., description="客户端名称"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """删除客户端"""
     # 从数据库中删除客户端
-    db = next(get_db())
-    try:
-        success = ClientDAO.delete(db, name)
-        if success:
-            # 从内存缓存中删除
-            if name in registered_clients:
-                del registered_clients[name]
-            
-            # 从离线列表中删除
-            offline_clients[:] = [
-                c for c in offline_clients 
-                if c.name != name
-            ]
-            
-            logger.info(f"Client deleted: {name}")
-            return {}
-        else:
-            return {"error": "Client not found"}
-    finally:
-        db.close()
+    success = await ClientDAO.delete(db, name)
+    if success:
+        # 从内存缓存中删除
+        registered_clients.pop(name, None)
+        
+        # 从离线列表中删除
+        offline_clients.pop(name, None)
+        
+        await cache_delete(CLIENTS_CACHE_KEY, OFFLINE_CACHE_KEY)
+        logger.info(f"Client deleted: {name}")
+        return {}
+    else:
+        return {"error": "Client not found"}
 
 
 @app.websocket("/ws")
@@ -210,60 +267,78 @@ async def websocket_endpoint(websocket: WebSocket):
     """WebSocket端点，接收客户端上报的数据"""
     await manager.connect(websocket)
     client_name = None
+    client_os = ""  # 操作系统信息在上线命令中发送一次，用于补全该连接的报告记录
     
     try:
         while True:
-            # 接收消息
-            data = await websocket.receive_text()
-            logger.info(f"Received message: {data}")
+            # 接收消息，报告为二进制帧，其他命令为JSON文本帧
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            if message.get("bytes") is not None:
+                data = message["bytes"]
+                try:
+                    # 根据帧的第一个字节分发
+                    if data and data[0] == FrameType.CLIENT_REPORT_BATCH:
+                        # 报告归属于发送上线命令的客户端，上线前收到的报告直接拒绝
+                        if client_name is None:
+                            raise ValueError("Report batch received before CLIENT_ONLINE")
+                        # 二进制帧结构固定，直接转换为数据库字典，不经过Report模型校验
+                        for report_data in unpack_report_batch(data):
+                            report_data["name"] = client_name
+                            report_data["os"] = client_os
+                            report_data["timestamp"] = datetime.utcfromtimestamp(report_data["timestamp"] / 1000)
+                            await report_queue.put(report_data)
+                    else:
+                        logger.warning(f"Unknown frame type: {data[:1]!r}")
+                except Exception as e:
+                    logger.error(f"Error processing frame: {e}")
+                    await manager.send_personal_message(
+                        orjson.dumps({"error": str(e)}).decode(), websocket
+                    )
+                continue
+            
+            data = message["text"]
+            logger.debug("Received message: %s", data)
             
             try:
-                # 解析命令
-                command_data = json.loads(data)
-                command = Command(**command_data)
+                # 解析命令，直接从JSON文本校验，不构建中间字典
+                command = COMMAND_ADAPTER.validate_json(data)
                 
                 # 处理不同类型的命令
                 if command.type == CommandType.CLIENT_ONLINE:
                     # 客户端上线
                     client_data = command.contents.get("client")
-                    client = Client(**client_data)
+                    client = CLIENT_ADAPTER.validate_python(client_data)
                     registered_clients[client.name] = client
                     client_name = client.name
+                    client_os = command.contents.get("os") or ""
                     
                     # 更新数据库中的客户端状态
-                    db = next(get_db())
                     try:
-                        ClientDAO.create_or_update(db, client.name, client.ip, True)
+                        async with AsyncSessionLocal() as db:
+                            await ClientDAO.create_or_update(db, client.name, client.ip, True)
                         logger.info(f"Updated client {client.name} in database")
                     except Exception as e:
                         logger.error(f"Error updating client in database: {e}")
-                    finally:
-                        db.close()
                     
                     # 从离线列表中移除
-                    offline_clients[:] = [
-                        c for c in offline_clients 
-                        if c.name != client.name
-                    ]
+                    offline_clients.pop(client.name, None)
                     
+                    await cache_delete(CLIENTS_CACHE_KEY, OFFLINE_CACHE_KEY)
+                    notify_dashboards("client_online", client)
                     logger.info(f"Client online: {client.name}")
                 
                 elif command.type == CommandType.CLIENT_REPORT:
                     # 客户端报告
                     report_data = command.contents.get("report")
-                    report = Report(**report_data)
+                    report = REPORT_ADAPTER.validate_python(report_data)
                     
-                    # 存储报告到数据库
-                    db = next(get_db())
-                    try:
-                        RecordDAO.create(db, report.to_db_dict())
-                        logger.info(f"Saved report from {report.name} to database")
-                    except Exception as e:
-                        logger.error(f"Error saving report to database: {e}")
-                    finally:
-                        db.close()
+                    # 放入报告队列，由后台任务批量写入数据库
+                    await report_queue.put(report.to_db_dict())
                     
-                    logger.info(f"Received report from {report.name}")
+                    logger.debug("Received report from %s", report.name)
                 
                 else:
                     logger.warning(f"Unknown command type: {command.type}")
@@ -271,7 +346,7 @@ async def websocket_endpoint(websocket: WebSocket):
             except Exception as e:
                 logger.error(f"Error processing command: {e}")
                 await manager.send_personal_message(
-                    json.dumps({"error": str(e)}), websocket
+                    orjson.dumps({"error": str(e)}).decode(), websocket
                 )
                 
     except WebSocketDisconnect:
@@ -281,29 +356,48 @@ async def websocket_endpoint(websocket: WebSocket):
         if client_name and client_name in registered_clients:
             client = registered_clients[client_name]
             client.online = False
-            offline_clients.append(client)
+            offline_clients[client_name] = client
             
             # 更新数据库中的客户端状态
-            db = next(get_db())
             try:
-                ClientDAO.set_offline(db, client_name)
+                async with AsyncSessionLocal() as db:
+                    await ClientDAO.set_offline(db, client_name)
                 logger.info(f"Updated client {client_name} status to offline in database")
             except Exception as e:
                 logger.error(f"Error updating client status in database: {e}")
-            finally:
-                db.close()
             
+            await cache_delete(CLIENTS_CACHE_KEY, OFFLINE_CACHE_KEY)
+            notify_dashboards("client_offline", client)
             logger.info(f"Client offline: {client_name}")
 
 
+@app.websocket("/ws/dashboard")
+async def dashboard_websocket_endpoint(websocket: WebSocket):
+    """WebSocket端点，向仪表板推送客户端上下线通知"""
+    await dashboard_manager.connect(websocket)
+    try:
+        # 仪表板只接收推送，读取消息仅用于检测断开
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        dashboard_manager.disconnect(websocket)
+
+
 if __name__ == "__main__":
     import uvicorn
     
-    # 启动服务
+    # 启动服务，使用uvloop事件循环和httptools解析器（uvloop不支持Windows）
+    # 客户端状态和报告队列保存在进程内存中，只能以单进程运行
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=10641,
-        reload=True,
-        log_level="info"
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        ws="websockets",
+        ws_per_message_deflate=True,
+        reload=False,
+        log_level="warning"
     )
\ No newline at end of file
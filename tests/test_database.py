@@ -0,0 +1,103 @@
+"""
+数据访问对象测试
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.database import Base, Config, ConfigDAO
+
+
+@pytest.fixture
+def session_local(tmp_path):
+    """临时数据库的会话工厂"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async def create_all():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_all())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+def run_with_session(session_local, func):
+    """在新会话中执行func(db)并返回结果"""
+    async def run():
+        async with session_local() as db:
+            return await func(db)
+
+    return asyncio.run(run())
+
+
+def stored_configs(session_local):
+    async def query(db):
+        result = await db.execute(select(Config))
+        return {config.key: config for config in result.scalars().all()}
+
+    return run_with_session(session_local, query)
+
+
+def add_existing_config(session_local, key, value, description):
+    """写入一条更新时间较早的配置"""
+    async def add(db):
+        db.add(Config(key=key, value=value, description=description, updated_at=datetime(2020, 1, 1)))
+        await db.commit()
+
+    run_with_session(session_local, add)
+
+
+def test_upsert_many_updates_and_inserts(session_local):
+    add_existing_config(session_local, "system.interval", "5", "上报间隔")
+
+    run_with_session(session_local, lambda db: ConfigDAO.upsert_many(db, [
+        {"key": "system.interval", "value": "10"},
+        {"key": "system.name", "value": "overwatch"},
+    ]))
+
+    configs = stored_configs(session_local)
+    assert configs["system.interval"].value == "10"
+    assert configs["system.interval"].description == "上报间隔"
+    assert configs["system.interval"].updated_at > datetime(2020, 1, 1)
+    assert configs["system.name"].value == "overwatch"
+    assert configs["system.name"].description is None
+
+
+def test_upsert_many_accepts_rows_with_different_keys(session_local):
+    run_with_session(session_local, lambda db: ConfigDAO.upsert_many(db, [
+        {"key": "alert.cpu", "value": "90", "description": "CPU告警阈值"},
+        {"key": "alert.load", "value": "4"},
+    ]))
+
+    configs = stored_configs(session_local)
+    assert configs["alert.cpu"].description == "CPU告警阈值"
+    assert configs["alert.load"].value == "4"
+
+
+def test_insert_missing_keeps_existing_values(session_local):
+    add_existing_config(session_local, "system.interval", "5", "上报间隔")
+
+    async def insert(db):
+        async with db.begin():
+            await ConfigDAO.insert_missing(db, [
+                {"key": "system.interval", "value": "60", "description": "默认上报间隔"},
+                {"key": "system.name", "value": "overwatch"},
+            ])
+
+    run_with_session(session_local, insert)
+
+    configs = stored_configs(session_local)
+    assert configs["system.interval"].value == "5"
+    assert configs["system.interval"].description == "上报间隔"
+    assert configs["system.interval"].updated_at == datetime(2020, 1, 1)
+    assert configs["system.name"].value == "overwatch"
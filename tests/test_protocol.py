@@ -0,0 +1,103 @@
+"""
+二进制报告协议测试
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.protocol import (
+    BATCH_HEADER_STRUCT, MAX_BATCH_RECORDS, REPORT_STRUCT, FrameType, ReportPacker, unpack_report_batch
+)
+
+
+def load_client_module():
+    """按文件路径加载客户端模块，各服务的main.py同名，不能直接import"""
+    spec = importlib.util.spec_from_file_location("client_main", os.path.join(ROOT, "client", "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeWebSocket:
+    """记录发送的帧，可在第fail_at次发送时抛出连接异常"""
+
+    def __init__(self, fail_at=None):
+        self.frames = []
+        self.fail_at = fail_at
+
+    async def send(self, data):
+        if self.fail_at is not None and len(self.frames) == self.fail_at:
+            raise ConnectionError("connection lost")
+        self.frames.append(data)
+
+
+def test_pack_unpack_round_trip():
+    packer = ReportPacker(8)
+    records = [packer.pack(0.23, 1700000000000), packer.pack(1.5, 1700000001000)]
+    frame = ReportPacker.pack_batch(records)
+
+    assert frame[0] == FrameType.CLIENT_REPORT_BATCH
+    assert len(frame) == BATCH_HEADER_STRUCT.size + 2 * REPORT_STRUCT.size
+    assert unpack_report_batch(frame) == [
+        {"load": 0.23, "cpus": 8, "timestamp": 1700000000000},
+        {"load": 1.5, "cpus": 8, "timestamp": 1700000001000},
+    ]
+
+
+def test_unpack_empty_batch():
+    assert unpack_report_batch(ReportPacker.pack_batch([])) == []
+
+
+def test_unpack_truncated_body():
+    frame = ReportPacker.pack_batch([ReportPacker(4).pack(0.5, 1)] * 3)
+    with pytest.raises(ValueError):
+        unpack_report_batch(frame[:-1])
+
+
+def test_writer_splits_at_max_batch_records():
+    client_main = load_client_module()
+    packer = ReportPacker(2)
+    records = [packer.pack(float(i), i) for i in range(MAX_BATCH_RECORDS + 10)]
+
+    async def run():
+        client = client_main.OverwatchClient()
+        client._outbox.append(records[:MAX_BATCH_RECORDS - 5])
+        client._outbox.append(records[MAX_BATCH_RECORDS - 5:])
+        websocket = FakeWebSocket()
+        writer = asyncio.create_task(client._writer(websocket))
+        await asyncio.sleep(0.01)
+        writer.cancel()
+        return client, websocket
+
+    client, websocket = asyncio.run(run())
+
+    assert not client._outbox
+    assert [len(unpack_report_batch(frame)) for frame in websocket.frames] == [MAX_BATCH_RECORDS, 10]
+    sent = [report for frame in websocket.frames for report in unpack_report_batch(frame)]
+    assert [report["timestamp"] for report in sent] == list(range(MAX_BATCH_RECORDS + 10))
+
+
+def test_writer_requeues_unsent_records():
+    client_main = load_client_module()
+    packer = ReportPacker(2)
+    records = [packer.pack(float(i), i) for i in range(MAX_BATCH_RECORDS + 10)]
+
+    async def run():
+        client = client_main.OverwatchClient()
+        client._outbox.append(list(records))
+        websocket = FakeWebSocket(fail_at=1)
+        with pytest.raises(ConnectionError):
+            await client._writer(websocket)
+        return client, websocket
+
+    client, websocket = asyncio.run(run())
+
+    assert len(websocket.frames) == 1
+    assert list(client._outbox) == [records[MAX_BATCH_RECORDS:]]
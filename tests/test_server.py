@@ -0,0 +1,132 @@
+"""
+监控服务器报告批量写入测试
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.database import Base, Record
+
+
+def load_server_module():
+    """按文件路径加载服务器模块，各服务的main.py同名，不能直接import"""
+    spec = importlib.util.spec_from_file_location("server_main", os.path.join(ROOT, "server", "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def server_main(tmp_path, monkeypatch):
+    """使用临时数据库的服务器模块"""
+    module = load_server_module()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async def create_all():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_all())
+    monkeypatch.setattr(module, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+    yield module
+    asyncio.run(engine.dispose())
+
+
+def make_report(i):
+    return {
+        "name": "client01",
+        "os": "Linux",
+        "load": i / 10,
+        "cpus": 4,
+        "timestamp": datetime(2024, 1, 1, 0, 0, i),
+    }
+
+
+def stored_records(server_main):
+    async def query():
+        async with server_main.AsyncSessionLocal() as db:
+            result = await db.execute(select(Record).order_by(Record.timestamp))
+            return result.scalars().all()
+
+    return asyncio.run(query())
+
+
+def stored_loads(server_main):
+    return [record.load for record in stored_records(server_main)]
+
+
+def test_bulk_create_fills_missing_metrics(server_main):
+    async def run():
+        async with server_main.AsyncSessionLocal() as db:
+            reports = [make_report(1), {**make_report(2), "memory_total": 16.0}]
+            return await server_main.RecordDAO.bulk_create(db, reports)
+
+    assert asyncio.run(run()) == 2
+    records = stored_records(server_main)
+    assert [record.memory_total for record in records] == [0.0, 16.0]
+    assert all(record.disk_percent == 0.0 for record in records)
+
+
+def test_flush_loop_writes_queued_reports(server_main, monkeypatch):
+    monkeypatch.setattr(server_main, "REPORT_FLUSH_INTERVAL", 0.05)
+
+    async def run():
+        # 队列在事件循环内创建，避免绑定到其他测试的事件循环
+        server_main.report_queue = asyncio.Queue()
+        flush_task = asyncio.create_task(server_main.flush_reports_loop())
+        for i in range(5):
+            await server_main.report_queue.put(make_report(i))
+        await asyncio.sleep(0.3)
+        flush_task.cancel()
+        await asyncio.gather(flush_task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert stored_loads(server_main) == [i / 10 for i in range(5)]
+
+
+def test_lifespan_drains_queue_on_shutdown(server_main, monkeypatch):
+    async def noop():
+        pass
+
+    monkeypatch.setattr(server_main, "init_db", noop)
+    monkeypatch.setattr(server_main, "register_to_register_center", noop)
+
+    async def run():
+        server_main.report_queue = asyncio.Queue()
+        async with server_main.lifespan(server_main.app):
+            # 第一条报告被写入任务取出后在等待合并时取消，其余报告仍在队列中
+            await server_main.report_queue.put(make_report(0))
+            await asyncio.sleep(0.05)
+            for i in range(1, 4):
+                server_main.report_queue.put_nowait(make_report(i))
+
+    asyncio.run(run())
+    assert stored_loads(server_main) == [i / 10 for i in range(4)]
+
+
+def test_lifespan_saves_reports_left_in_queue(server_main, monkeypatch):
+    async def noop():
+        pass
+
+    monkeypatch.setattr(server_main, "init_db", noop)
+    monkeypatch.setattr(server_main, "register_to_register_center", noop)
+
+    async def run():
+        server_main.report_queue = asyncio.Queue()
+        async with server_main.lifespan(server_main.app):
+            # 写入任务尚未运行就被取消，报告全部由关闭流程从队列中取出写入
+            for i in range(3):
+                server_main.report_queue.put_nowait(make_report(i))
+
+    asyncio.run(run())
+    assert stored_loads(server_main) == [i / 10 for i in range(3)]
@@ -0,0 +1,21 @@
+"""
+启动冒烟测试
+逐个导入各服务的入口模块，确保依赖和模块级初始化（数据库引擎、校验器等）可以正常构建
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("service", ["client", "register", "server", "web"])
+def test_service_imports(service):
+    """各服务的main模块可以成功导入"""
+    spec = importlib.util.spec_from_file_location(
+        f"{service}_main", os.path.join(ROOT, service, "main.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
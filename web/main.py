@@ -3,22 +3,30 @@ Web界面应用
 提供监控系统的Web界面
 """
 
-import json
 import logging
+import time
 from typing import Dict, List, Optional
+import orjson
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, Form, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
+from datetime import datetime, timedelta
+from fastapi import FastAPI, Request, Form, Query, Depends
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, RedirectResponse, ORJSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 import httpx
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from common.database import get_db, init_db, ClientDAO, RecordDAO, AlertDAO, ConfigDAO, UserDAO
+from common.database import AsyncSessionLocal, get_async_db, init_db, ClientDAO, RecordDAO, AlertDAO, ConfigDAO, UserDAO
+from common.database import User as UserRecord
 from common.models import Client, Report, Alert, Config, User
+from common.cache import cache_get, cache_set, cache_delete, close_cache
+from common.queries import get_online_clients, get_offline_clients, iter_reports_json
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -32,26 +40,11 @@ async def lifespan(app: FastAPI):
     """Web应用生命周期管理"""
     # 启动时初始化数据库
     # 初始化数据库
-    init_db()
+    await init_db()
     logger.info("Database initialized for web application")
     
-    # 创建默认管理员用户
-    db = next(get_db())
-    try:
-        # 检查是否已存在admin用户
-        admin_user = UserDAO.get_by_username(db, "admin")
-        if not admin_user:
-            # 创建默认管理员用户
-            # 注意：实际应用中应该使用密码哈希
-            admin_data = {
-                "username": "admin",
-                "password": "123456",  # 实际应用中应该存储哈希值
-                "email": "admin@example.com",
-                "is_active": True
-            }
-            UserDAO.create(db, User(**admin_data))
-            logger.info("Created default admin user")
-        
+    # 初始化默认管理员用户和默认配置
+    async with AsyncSessionLocal() as db:
         # 初始化默认配置
         default_configs = [
             {
@@ -101,21 +94,50 @@ async def lifespan(app: FastAPI):
             }
         ]
         
-        for config_data in default_configs:
-            existing_config = ConfigDAO.get_by_key(db, config_data["key"])
-            if not existing_config:
-                ConfigDAO.set(db, config_data["key"], config_data["value"], config_data["description"])
+        # 创建默认管理员用户
+        async with db.begin():
+            # 检查是否已存在admin用户
+            admin_user = await UserDAO.get_by_username(db, "admin")
+            if not admin_user:
+                # 创建默认管理员用户
+                # 注意：实际应用中应该使用密码哈希
+                admin_data = {
+                    "username": "admin",
+                    "password": "123456",  # 实际应用中应该存储哈希值
+                    "email": "admin@example.com",
+                    "is_active": True
+                }
+                db.add(UserRecord(**User(**admin_data).to_db_dict()))
+                logger.info("Created default admin user")
+            
+            # 一条语句插入所有缺失的默认配置，与管理员用户在同一事务中提交
+            await ConfigDAO.insert_missing(db, default_configs)
         
         logger.info("Database initialization completed")
-    finally:
-        db.close()
+    
+    # 代理到服务器API的请求共用一个HTTP客户端，复用keep-alive连接
+    app.state.http = httpx.AsyncClient(
+        base_url=SERVER_API_BASE,
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200)
+    )
     
     yield
     
-    # 关闭时的清理工作（如果需要）
+    # 关闭时的清理工作
+    await app.state.http.aclose()
+    await close_cache()
 
 # 创建FastAPI应用
-app = FastAPI(title="Overwatch Web Interface", version="1.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="Overwatch Web Interface",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+# 压缩较大的JSON响应，小于1KB的响应不压缩
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 # 静态文件
 import os
@@ -125,8 +147,100 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 # 服务器API地址
 SERVER_API_BASE = "http://127.0.0.1:10641"
 
+# 模拟数据使用的随机数生成器
+rng = np.random.default_rng()
+
+# 系统配置接口的缓存键和过期时间（秒），保存配置时主动失效
+CONFIG_CACHE_KEY = "config"
+CONFIG_CACHE_TTL = 30
+
+# 系统配置默认值，数据库中不存在的配置项使用默认值
+CONFIG_DEFAULTS = {
+    "system": {
+        "name": "集群监控系统",
+        "data_retention": "30",
+        "collection_interval": "60",
+        "max_clients": "100",
+        "log_level": "info",
+        "enable_auto_cleanup": "True",
+        "enable_debug_mode": "False"
+    },
+    "monitor": {
+        "cpu_warning": "70",
+        "cpu_critical": "90",
+        "cpu_enable": "True",
+        "memory_warning": "80",
+        "memory_critical": "95",
+        "memory_enable": "True",
+        "disk_warning": "80",
+        "disk_critical": "95",
+        "disk_enable": "True"
+    },
+    "alert": {
+        "enable": "True",
+        "cooldown": "15",
+        "consecutive": "3",
+        "recovery": "True"
+    },
+    "notification": {
+        "email_enable": "False",
+        "smtp_server": "",
+        "smtp_port": "587",
+        "email_username": "",
+        "email_password": "",
+        "email_recipients": "",
+        "webhook_enable": "False",
+        "webhook_url": ""
+    }
+}
+
+
+def _convert_config_value(value: str):
+    """将配置字符串转换为布尔值或整数，无法转换时保持字符串"""
+    lowered = value.lower()
+    if lowered == "true":
+        return True
+    if lowered == "false":
+        return False
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+def _to_bool(value: str):
+    """布尔配置项转换，非法值保持字符串"""
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    return value
 
 
+def _to_int(value: str):
+    """整数配置项转换，非法值保持字符串"""
+    return int(value) if value.isdigit() else value
+
+
+def _config_converter(default: str):
+    """根据默认值的类型确定配置项的转换函数"""
+    converted = _convert_config_value(default)
+    if isinstance(converted, bool):
+        return _to_bool
+    if isinstance(converted, int):
+        return _to_int
+    return str
+
+
+# 已知配置项的类型转换表和转换后的默认值，在导入时预先计算
+CONFIG_SCHEMA = {
+    (category, key): _config_converter(value)
+    for category, keys in CONFIG_DEFAULTS.items()
+    for key, value in keys.items()
+}
+_CONFIG_DEFAULT_VALUES = {
+    category: {key: CONFIG_SCHEMA[(category, key)](value) for key, value in keys.items()}
+    for category, keys in CONFIG_DEFAULTS.items()
+}
+
 
 @app.get("/", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -135,25 +249,26 @@ async def login_page(request: Request):
 
 
 @app.post("/login")
-async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+async def login(
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
+):
     """处理登录"""
     # 从数据库验证用户
-    db = next(get_db())
-    try:
-        user = UserDAO.get_by_username(db, username)
-        if user and user.password == password:  # 实际应用中应该验证密码哈希
-            # 更新最后登录时间
-            UserDAO.update_login_time(db, username)
-            # 登录成功，重定向到主页
-            return RedirectResponse(url="/index", status_code=303)
-        else:
-            # 登录失败，返回登录页面
-            return templates.TemplateResponse(
-                "login.html", 
-                {"request": request, "error": "用户名或密码错误"}
-            )
-    finally:
-        db.close()
+    user = await UserDAO.get_by_username(db, username)
+    if user and user.password == password:  # 实际应用中应该验证密码哈希
+        # 更新最后登录时间
+        await UserDAO.update_login_time(db, username)
+        # 登录成功，重定向到主页
+        return RedirectResponse(url="/index", status_code=303)
+    else:
+        # 登录失败，返回登录页面
+        return templates.TemplateResponse(
+            "login.html", 
+            {"request": request, "error": "用户名或密码错误"}
+        )
 
 
 @app.get("/index", response_class=HTMLResponse)
@@ -186,21 +301,18 @@ async def config_page(request: Request):
     return templates.TemplateResponse("config.html", {"request": request})
 
 
-# API端点，用于获取服务器数据
+# API端点，只读数据直接查询共享数据库，涉及服务器连接状态的操作仍转发到服务器API
 @app.get("/api/clients")
-async def get_clients():
+async def get_clients(db: AsyncSession = Depends(get_async_db)):
     """获取所有在线客户端"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{SERVER_API_BASE}/clients")
-        return response.json()
+    return await get_online_clients(db)
 
 
 @app.get("/api/alert")
-async def get_alerts():
+async def get_alerts(db: AsyncSession = Depends(get_async_db)):
     """获取所有离线客户端"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{SERVER_API_BASE}/alert")
-        return response.json()
+    # 服务器在客户端断开时会同步更新数据库中的在线状态
+    return await get_offline_clients(db)
 
 
 @app.get("/api/client/{client_name}")
@@ -210,52 +322,54 @@ async def get_client_reports(
     endtime: int = Query(int(9999999999999))
 ):
     """获取客户端报告"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SERVER_API_BASE}/client",
-            params={
-                "name": client_name,
-                "starttime": starttime,
-                "endtime": endtime
-            }
-        )
-        return response.json()
+    start_dt = datetime.fromtimestamp(starttime / 1000)
+    end_dt = datetime.fromtimestamp(endtime / 1000)
+    
+    return StreamingResponse(iter_reports_json(client_name, start_dt, end_dt), media_type="application/json")
 
 
 @app.get("/api/delete_client")
 async def delete_client(name: str = Query(...)):
     """删除客户端"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SERVER_API_BASE}/delclient",
-            params={"name": name}
-        )
-        return response.json()
+    response = await app.state.http.get("/delclient", params={"name": name})
+    return orjson.loads(response.content)
 
 
 @app.get("/api/realtime")
 async def get_realtime_data():
     """获取实时数据"""
-    # 模拟实时数据
-    import random
-    import time
+    # 模拟实时数据，每个序列一次生成，时间轴所有序列共用
+    timestamps = (time.time() - np.arange(60, 0, -1) * 60).tolist()
     
-    return {
+    def series(low, high):
+        return [
+            {"timestamp": timestamp, "value": value}
+            for timestamp, value in zip(timestamps, rng.uniform(low, high, 60).tolist())
+        ]
+    
+    return ORJSONResponse({
         "cluster": {
-            "cpu": random.uniform(20, 80),
-            "memory": random.uniform(30, 90),
-            "disk": random.uniform(40, 70),
-            "network": random.uniform(5, 50),
-            "network_in": random.uniform(5, 30),
-            "network_out": random.uniform(2, 20)
+            "cpu": rng.uniform(20, 80),
+            "memory": rng.uniform(30, 90),
+            "disk": rng.uniform(40, 70),
+            "network": rng.uniform(5, 50),
+            "network_in": rng.uniform(5, 30),
+            "network_out": rng.uniform(2, 20)
         },
         "time_series": {
-            "cpu": [{"timestamp": time.time() - i * 60, "value": random.uniform(20, 80)} for i in range(60, 0, -1)],
-            "memory": [{"timestamp": time.time() - i * 60, "value": random.uniform(30, 90)} for i in range(60, 0, -1)],
-            "disk": [{"timestamp": time.time() - i * 60, "value": random.uniform(40, 70)} for i in range(60, 0, -1)],
-            "network": [{"timestamp": time.time() - i * 60, "in": random.uniform(5, 30), "out": random.uniform(2, 20)} for i in range(60, 0, -1)]
+            "cpu": series(20, 80),
+            "memory": series(30, 90),
+            "disk": series(40, 70),
+            "network": [
+                {"timestamp": timestamp, "in": network_in, "out": network_out}
+                for timestamp, network_in, network_out in zip(
+                    timestamps,
+                    rng.uniform(5, 30, 60).tolist(),
+                    rng.uniform(2, 20, 60).tolist()
+                )
+            ]
         }
-    }
+    })
 
 
 @app.get("/api/history")
@@ -269,224 +383,152 @@ async def get_history_data(
 ):
     """获取历史数据"""
     # 模拟历史数据
-    import random
-    import time
-    from datetime import datetime, timedelta
-    
     # 生成时间标签
-    labels = []
     now = datetime.now()
-    for i in range(24):
-        labels.append((now - timedelta(hours=i)).strftime("%H:%M"))
-    labels.reverse()
+    labels = [(now - timedelta(hours=i)).strftime("%H:%M") for i in range(23, -1, -1)]
     
-    # 生成数据
-    return {
+    # 生成记录，每个字段一次生成page_size个值
+    count = max(page_size, 0)
+    records = zip(
+        rng.integers(1, 11, count).tolist(),
+        rng.uniform(20, 80, count).tolist(),
+        rng.uniform(30, 90, count).tolist(),
+        rng.uniform(40, 70, count).tolist(),
+        rng.uniform(5, 30, count).tolist(),
+        rng.uniform(2, 20, count).tolist()
+    )
+    
+    # 生成数据，图表序列直接以NumPy数组返回，由orjson序列化
+    return ORJSONResponse({
         "statistics": {
-            "avg_cpu": random.uniform(20, 80),
-            "avg_memory": random.uniform(30, 90),
-            "avg_disk": random.uniform(40, 70),
-            "total_network": random.uniform(100, 1000)
+            "avg_cpu": rng.uniform(20, 80),
+            "avg_memory": rng.uniform(30, 90),
+            "avg_disk": rng.uniform(40, 70),
+            "total_network": rng.uniform(100, 1000)
         },
         "chart_data": {
             "labels": labels,
-            "cpu": [random.uniform(20, 80) for _ in range(24)],
-            "memory": [random.uniform(30, 90) for _ in range(24)],
-            "disk": [random.uniform(40, 70) for _ in range(24)],
-            "network_in": [random.uniform(5, 30) for _ in range(24)],
-            "network_out": [random.uniform(2, 20) for _ in range(24)]
+            "cpu": rng.uniform(20, 80, 24),
+            "memory": rng.uniform(30, 90, 24),
+            "disk": rng.uniform(40, 70, 24),
+            "network_in": rng.uniform(5, 30, 24),
+            "network_out": rng.uniform(2, 20, 24)
         },
         "records": [
             {
                 "timestamp": (now - timedelta(hours=i)).isoformat(),
-                "client_id": f"client_{random.randint(1, 10)}",
+                "client_id": f"client_{client}",
                 "client_name": f"服务器{i}",
-                "cpu_usage": random.uniform(20, 80),
-                "memory_usage": random.uniform(30, 90),
-                "disk_usage": random.uniform(40, 70),
-                "network_in": random.uniform(5, 30),
-                "network_out": random.uniform(2, 20)
-            } for i in range(page_size)
+                "cpu_usage": cpu,
+                "memory_usage": memory,
+                "disk_usage": disk,
+                "network_in": network_in,
+                "network_out": network_out
+            } for i, (client, cpu, memory, disk, network_in, network_out) in enumerate(records)
         ],
         "pagination": {
             "current_page": page,
             "total_pages": 5,
             "total_records": 100
         }
-    }
+    })
 
 
 @app.get("/api/config")
-async def get_config():
+async def get_config(db: AsyncSession = Depends(get_async_db)):
     """获取系统配置"""
-    # 从数据库获取配置
-    db = next(get_db())
-    try:
-        configs = ConfigDAO.get_all(db)
-        config_dict = {}
-        
-        # 将配置转换为字典格式
-        for config in configs:
-            parts = config.key.split(".", 1)
-            if len(parts) == 2:
-                category, key = parts
-                if category not in config_dict:
-                    config_dict[category] = {}
-                config_dict[category][key] = config.value
-        
-        # 确保所有必要的配置都存在
-        defaults = {
-            "system": {
-                "name": "集群监控系统",
-                "data_retention": "30",
-                "collection_interval": "60",
-                "max_clients": "100",
-                "log_level": "info",
-                "enable_auto_cleanup": "True",
-                "enable_debug_mode": "False"
-            },
-            "monitor": {
-                "cpu_warning": "70",
-                "cpu_critical": "90",
-                "cpu_enable": "True",
-                "memory_warning": "80",
-                "memory_critical": "95",
-                "memory_enable": "True",
-                "disk_warning": "80",
-                "disk_critical": "95",
-                "disk_enable": "True"
-            },
-            "alert": {
-                "enable": "True",
-                "cooldown": "15",
-                "consecutive": "3",
-                "recovery": "True"
-            },
-            "notification": {
-                "email_enable": "False",
-                "smtp_server": "",
-                "smtp_port": "587",
-                "email_username": "",
-                "email_password": "",
-                "email_recipients": "",
-                "webhook_enable": "False",
-                "webhook_url": ""
-            }
-        }
-        
-        # 合并默认值和数据库中的值
-        for category, keys in defaults.items():
-            if category not in config_dict:
-                config_dict[category] = {}
-            for key, value in keys.items():
-                if key not in config_dict[category]:
-                    config_dict[category][key] = value
-        
-        # 转换字符串值为适当的类型
-        for category, keys in config_dict.items():
-            for key, value in keys.items():
-                if value.lower() == "true":
-                    config_dict[category][key] = True
-                elif value.lower() == "false":
-                    config_dict[category][key] = False
-                elif value.isdigit():
-                    config_dict[category][key] = int(value)
-        
-        return config_dict
-    finally:
-        db.close()
+    cached = await cache_get(CONFIG_CACHE_KEY)
+    if cached is not None:
+        return cached
+    
+    # 从数据库获取配置，在默认值的基础上一次遍历完成合并和类型转换
+    configs = await ConfigDAO.get_all(db)
+    config_dict = {category: dict(keys) for category, keys in _CONFIG_DEFAULT_VALUES.items()}
+    for config in configs:
+        parts = config.key.split(".", 1)
+        if len(parts) == 2:
+            category, key = parts
+            convert = CONFIG_SCHEMA.get((category, key), _convert_config_value)
+            config_dict.setdefault(category, {})[key] = convert(config.value)
+    
+    await cache_set(CONFIG_CACHE_KEY, config_dict, CONFIG_CACHE_TTL)
+    return config_dict
+
+
+def _config_rows(prefix: str, config: dict):
+    """将提交的配置转换为批量写入的行，键加上分类前缀，值统一保存为字符串"""
+    return [{"key": f"{prefix}{key}", "value": str(value)} for key, value in config.items()]
 
 
 @app.post("/api/config/system")
-async def save_system_config(config: dict):
+async def save_system_config(config: dict, db: AsyncSession = Depends(get_async_db)):
     """保存系统配置"""
     # 保存配置到数据库
-    db = next(get_db())
     try:
-        for key, value in config.items():
-            config_key = f"system.{key}"
-            ConfigDAO.set(db, config_key, str(value))
+        await ConfigDAO.upsert_many(db, _config_rows("system.", config))
         
+        await cache_delete(CONFIG_CACHE_KEY)
         return {"success": True, "message": "系统配置保存成功"}
     except Exception as e:
         logger.error(f"Error saving system config: {e}")
         return {"success": False, "message": f"保存系统配置失败: {str(e)}"}
-    finally:
-        db.close()
 
 
 @app.post("/api/config/monitor")
-async def save_monitor_config(config: dict):
+async def save_monitor_config(config: dict, db: AsyncSession = Depends(get_async_db)):
     """保存监控配置"""
     # 保存配置到数据库
-    db = next(get_db())
     try:
-        for key, value in config.items():
-            config_key = f"monitor.{key}"
-            ConfigDAO.set(db, config_key, str(value))
+        await ConfigDAO.upsert_many(db, _config_rows("monitor.", config))
         
+        await cache_delete(CONFIG_CACHE_KEY)
         return {"success": True, "message": "监控配置保存成功"}
     except Exception as e:
         logger.error(f"Error saving monitor config: {e}")
         return {"success": False, "message": f"保存监控配置失败: {str(e)}"}
-    finally:
-        db.close()
 
 
 @app.post("/api/config/alert")
-async def save_alert_config(config: dict):
+async def save_alert_config(config: dict, db: AsyncSession = Depends(get_async_db)):
     """保存告警配置"""
     # 保存配置到数据库
-    db = next(get_db())
     try:
-        for key, value in config.items():
-            config_key = f"alert.{key}"
-            ConfigDAO.set(db, config_key, str(value))
+        await ConfigDAO.upsert_many(db, _config_rows("alert.", config))
         
+        await cache_delete(CONFIG_CACHE_KEY)
         return {"success": True, "message": "告警配置保存成功"}
     except Exception as e:
         logger.error(f"Error saving alert config: {e}")
         return {"success": False, "message": f"保存告警配置失败: {str(e)}"}
-    finally:
-        db.close()
 
 
 @app.post("/api/config/notification")
-async def save_notification_config(config: dict):
+async def save_notification_config(config: dict, db: AsyncSession = Depends(get_async_db)):
     """保存通知配置"""
     # 保存配置到数据库
-    db = next(get_db())
     try:
         # 处理嵌套的通知配置
-        if "email" in config:
-            for key, value in config["email"].items():
-                config_key = f"notification.email_{key}"
-                ConfigDAO.set(db, config_key, str(value))
-        
-        if "webhook" in config:
-            for key, value in config["webhook"].items():
-                config_key = f"notification.webhook_{key}"
-                ConfigDAO.set(db, config_key, str(value))
+        rows = _config_rows("notification.email_", config.get("email", {}))
+        rows += _config_rows("notification.webhook_", config.get("webhook", {}))
         
         # 处理扁平化的通知配置
-        for key, value in config.items():
-            if key not in ["email", "webhook"]:
-                config_key = f"notification.{key}"
-                ConfigDAO.set(db, config_key, str(value))
+        rows += _config_rows(
+            "notification.",
+            {key: value for key, value in config.items() if key not in ["email", "webhook"]}
+        )
+        await ConfigDAO.upsert_many(db, rows)
         
+        await cache_delete(CONFIG_CACHE_KEY)
         return {"success": True, "message": "通知配置保存成功"}
     except Exception as e:
         logger.error(f"Error saving notification config: {e}")
         return {"success": False, "message": f"保存通知配置失败: {str(e)}"}
-    finally:
-        db.close()
 
 
 @app.get("/api/config/backup")
 async def backup_config():
     """备份配置"""
     # 这里应该生成配置文件并返回
-    import json
     from fastapi.responses import Response
     
     config = {
@@ -502,7 +544,7 @@ async def backup_config():
     }
     
     return Response(
-        content=json.dumps(config, indent=2),
+        content=orjson.dumps(config, option=orjson.OPT_INDENT_2),
         media_type="application/json",
         headers={"Content-Disposition": "attachment; filename=config.json"}
     )
@@ -563,11 +605,13 @@ async def logout(request: Request):
 if __name__ == "__main__":
     import uvicorn
     
-    # 启动服务
+    # 启动服务，使用uvloop事件循环和httptools解析器（uvloop不支持Windows）
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8089,
-        reload=True,
-        log_level="info"
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        reload=False,
+        log_level="warning"
     )
\ No newline at end of file
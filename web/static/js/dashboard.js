@@ -6,12 +6,55 @@ document.addEventListener('DOMContentLoaded', function() {
     initCharts();
     
     // 加载初始数据
-    loadDashboardData();
+    loadRealtimeData();
     
-    // 设置定时刷新
-    setInterval(loadDashboardData, 30000); // 每30秒刷新一次
+    // 设置定时刷新，客户端上下线由推送通知更新，不需要轮询
+    setInterval(loadRealtimeData, 30000); // 每30秒刷新一次
+    
+    // 订阅客户端上下线通知，连接建立后加载客户端列表
+    subscribeClientEvents();
 });
 
+// 当前在线和离线的客户端名称，由接口数据初始化，之后根据推送的通知增量更新
+const onlineClients = new Set();
+const offlineClients = new Set();
+
+// 订阅服务器推送的客户端上下线通知，连接断开后5秒重连
+function subscribeClientEvents() {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.hostname}:10641/ws/dashboard`);
+    
+    // 首次连接和重连后重新获取客户端列表，补上断开期间错过的通知
+    socket.onopen = loadClientStatus;
+    
+    socket.onmessage = async function(event) {
+        const message = JSON.parse(await event.data.text());
+        const name = message.client.name;
+        if (message.type === 'client_online') {
+            onlineClients.add(name);
+            offlineClients.delete(name);
+        } else if (message.type === 'client_offline') {
+            offlineClients.add(name);
+            onlineClients.delete(name);
+        } else {
+            return;
+        }
+        updateClientCounts();
+    };
+    
+    socket.onclose = function() {
+        setTimeout(subscribeClientEvents, 5000);
+    };
+}
+
+// 根据客户端集合更新统计卡片和状态饼图
+function updateClientCounts() {
+    document.getElementById('online-count').textContent = onlineClients.size;
+    document.getElementById('offline-count').textContent = offlineClients.size;
+    window.statusChart.data.datasets[0].data = [onlineClients.size, offlineClients.size];
+    window.statusChart.update();
+}
+
 // 初始化图表
 function initCharts() {
     // 系统负载趋势图
@@ -71,8 +114,8 @@ function initCharts() {
     });
 }
 
-// 加载仪表板数据
-async function loadDashboardData() {
+// 加载客户端在线和离线列表
+async function loadClientStatus() {
     try {
         // 获取客户端列表
         const clientsResponse = await fetch('/api/clients');
@@ -82,36 +125,38 @@ async function loadDashboardData() {
         const alertsResponse = await fetch('/api/alert');
         const alertsData = await alertsResponse.json();
         
+        onlineClients.clear();
+        offlineClients.clear();
+        (clientsData || []).forEach(client => onlineClients.add(client.name));
+        (alertsData || []).forEach(client => offlineClients.add(client.name));
+        
+        // 更新统计卡片和状态饼图
+        updateClientCounts();
+        
+    } catch (error) {
+        console.error('Error loading client status:', error);
+    }
+}
+
+// 加载实时数据
+async function loadRealtimeData() {
+    try {
         // 获取实时数据
         const realtimeResponse = await fetch('/api/realtime');
         const realtimeData = await realtimeResponse.json();
         
-        // 更新统计卡片
-        updateStatCards(clientsData, alertsData, realtimeData);
+        // 平均CPU使用率
+        const avgCpu = realtimeData && realtimeData.cluster ? realtimeData.cluster.cpu.toFixed(1) : 0;
+        document.getElementById('avg-cpu').textContent = avgCpu + '%';
         
         // 更新图表
         updateCharts(realtimeData);
         
     } catch (error) {
-        console.error('Error loading dashboard data:', error);
+        console.error('Error loading realtime data:', error);
     }
 }
 
-// 更新统计卡片
-function updateStatCards(clients, alerts, realtime) {
-    // 在线客户端数量
-    const onlineCount = clients ? clients.length : 0;
-    document.getElementById('online-count').textContent = onlineCount;
-    
-    // 离线客户端数量
-    const offlineCount = alerts ? alerts.length : 0;
-    document.getElementById('offline-count').textContent = offlineCount;
-    
-    // 平均CPU使用率
-    const avgCpu = realtime && realtime.cluster ? realtime.cluster.cpu.toFixed(1) : 0;
-    document.getElementById('avg-cpu').textContent = avgCpu + '%';
-}
-
 // 更新图表
 function updateCharts(realtime) {
     if (!realtime || !realtime.time_series) return;
@@ -130,10 +175,4 @@ function updateCharts(realtime) {
     window.loadChart.data.datasets[1].data = timeSeries.memory.map(item => item.value);
     window.loadChart.data.datasets[2].data = timeSeries.disk.map(item => item.value);
     window.loadChart.update();
-    
-    // 更新状态饼图
-    const onlineCount = parseInt(document.getElementById('online-count').textContent);
-    const offlineCount = parseInt(document.getElementById('offline-count').textContent);
-    window.statusChart.data.datasets[0].data = [onlineCount, offlineCount];
-    window.statusChart.update();
 }
\ No newline at end of file